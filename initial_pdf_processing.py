@@ -1,310 +1,433 @@
 import fitz  # PyMuPDF
 import re
 import pandas as pd
-from collections import defaultdict
+from datetime import datetime
 from dateutil.parser import parse
 import os
+import sys
 import argparse
+import functools
+import hashlib
+import logging
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+log = logging.getLogger(__name__)
+_LOG_FORMAT = "%(levelname)s: %(message)s"
+
+# "Mon DD, YYYY" dates, used for Scan date headers and the non-Scan report date
+_FULL_DATE_RE = re.compile(r"((?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},\s+\d{4})")
+
+# Line kinds assigned by _classify_lines for extract_table_data_scan
+_HEADER, _DATE, _NAME, _RANGE, _UNIT, _VALUE = range(6)
+
+# Parser states for extract_table_data_scan
+_SEEK_HEADER, _IN_DATES, _IN_ROWS, _IN_RANGE = range(4)
+
+
+# Lab result block used by extract_table_data_other:
+#   Test Name
+#   Normal Range: [range]
+#   [Value]
+# Blocks are located by the literal anchor below; the test name is the run of
+# name characters right before it and the range/value pattern is matched
+# right after it. \s and \d keep their Unicode meaning, so text that PyMuPDF
+# emits with no-break or other Unicode spaces still matches. The Range class
+# takes the whitespace after the anchor itself (Range is stripped anyway):
+# a separate leading \s* could split a long whitespace run between the two
+# in quadratically many ways before failing.
+_RANGE_ANCHOR = "\nNormal Range:"
+_TEST_TAIL_RE = re.compile(r"[A-Za-z0-9 \(\)\[\]\-\/]+$")
+_RANGE_VALUE_RE = re.compile(
+    r"(?P<Range>[><=0-9.\-–\s]+[a-zA-Z/%²μ]+)\n(?P<Value>[><=0-9. \s]+[a-zA-Z/%²μ]+)"
+)
+
+def extract_text_from_doc(doc):
+    """Extract all text from an already opened PyMuPDF document."""
+    log.debug("Processing PDF with %d pages", len(doc))
+    # Collect page texts and join once instead of growing a string per page
+    parts = []
+    for page_num, page in enumerate(doc):
+        page_text = page.get_text()
+        log.debug("Page %d content length: %d", page_num + 1, len(page_text))
+        parts.append(page_text)
+        parts.append("\n" + "="*80 + "\n")  # Add page separator
+    return "".join(parts)
 
 def extract_text_from_pdf(filepath):
     """Extract all text from a PDF file using PyMuPDF."""
     doc = fitz.open(filepath)
-    text = ""
-    print(f"\nProcessing PDF with {len(doc)} pages")
-    for page_num, page in enumerate(doc):
-        page_text = page.get_text()
-        print(f"\nPage {page_num + 1} content length: {len(page_text)}")
-        text += page_text + "\n" + "="*80 + "\n"  # Add page separator
-    doc.close()
-    return text
+    try:
+        return extract_text_from_doc(doc)
+    finally:
+        doc.close()
+
+_MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+           "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+_MONTH_ABBRS = tuple(_MONTHS)
+
+def _fast_parse(date_str):
+    """Parse the fixed "Mon DD, YYYY" header format without going through dateutil."""
+    month, rest = date_str.split(" ", 1)
+    day, year = rest.split(", ")
+    return datetime(int(year), _MONTHS[month], int(day))
+
+@functools.lru_cache(maxsize=None)
+def _parsed(date_str):
+    """
+    Parse a date header once; repeated lookups of the same string are cached.
+    Headers that are not plain "Mon DD, YYYY" fall back to dateutil.
+    """
+    try:
+        return _fast_parse(date_str)
+    except (KeyError, ValueError):
+        return parse(date_str)
 
 def get_pdf_files(directory):
     """Get all PDF files from the specified directory."""
-    pdf_files = []
-    for file in os.listdir(directory):
-        if file.lower().endswith('.pdf'):
-            pdf_files.append(os.path.join(directory, file))
-    return pdf_files
+    # DirEntry already carries the joined path and cached file-type info; the
+    # with block closes the directory handle as soon as the listing is done
+    with os.scandir(directory) as entries:
+        return [e.path for e in entries if e.is_file() and e.name[-4:].lower() == '.pdf']
+
+def _classify_lines(lines):
+    """
+    Tag each line of a Scan file as it is read, so the parser can dispatch on
+    the tag instead of re-running the same string checks in every case.
+    Yields (line, tag, has_digit) tuples.
+    """
+    for line in lines:
+        # str.isdigit over the characters, as before: besides 0-9 it accepts
+        # every Unicode digit, e.g. superscripts and subscripts in "m²", "CO₂"
+        digit = any(map(str.isdigit, line))
+        if line.startswith("Component"):
+            tag = _HEADER
+        elif _FULL_DATE_RE.search(line):
+            tag = _DATE
+        elif line.startswith("Normal Range:"):
+            tag = _RANGE
+        elif not digit or line.upper() == "CO2":
+            # Component names have no digits, except for special cases like CO2
+            tag = _NAME
+        elif line.lower() == "m2":
+            tag = _UNIT
+        else:
+            tag = _VALUE
+        yield line, tag, digit
+
+class ScanLayoutError(ValueError):
+    """A Scan file's rows do not fit the combined date columns of its sections."""
+
+def _component_row(component, values, reference_range, width):
+    """Build a data row, padding with empty strings up to the number of dates."""
+    return [component] + values + [""] * (width - len(values)) + [reference_range]
 
 def extract_table_data_scan(text):
     """
     Extract table data from Scan files.
     This function now looks for dates in the header row.
     The header row is expected to begin with "Component" followed by one or more date strings.
+    The lines are read once, driven by a small state machine:
+    seeking a header, reading its dates, reading rows, or continuing a range.
+    Returns (records, dates) with one (test, date, value, range) record per cell.
     """
     try:
-        # Split text into lines and remove empty lines
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-
-        print("\nDebug: First few lines of text:")
-        for i, line in enumerate(lines[:10]):
-            print(f"Line {i}: {line}")
-            
-        print("\nDebug: Total number of lines:", len(lines))
-        
-        # Find all Component header rows
-        component_indices = []
-        for i, line in enumerate(lines):
-            if line.startswith("Component"):
-                component_indices.append(i)
-                #print(f"Found Component header at line {i}")
-        
-        if not component_indices:
-            print("Error: No 'Component' header rows found in text.")
-            return None, None
-        
-        #print(f"\nDebug: Found {len(component_indices)} Component rows at indices: {component_indices}")
-        
-        # Process each section
+        # Split text into lines and remove empty lines; map/filter strip each
+        # line once, without a per-line comprehension step
+        lines = list(filter(None, map(str.strip, text.split('\n'))))
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("First few lines of text:")
+            for i, line in enumerate(lines[:10]):
+                log.debug("Line %d: %s", i, line)
+            log.debug("Total number of lines: %d", len(lines))
+
         all_data_rows = []
         all_date_headers = set()
-        
-        for section_start in component_indices:
-            print(f"\nProcessing section starting at line {section_start}")
-            
-            # Look for dates in subsequent lines until we hit a non-date line
-            date_headers = []
-            date_pattern = re.compile(r"((?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},\s+\d{4})")
-            
-            # Start looking at the line after Component
-            current_line = section_start + 1
-            while current_line < len(lines):
-                line = lines[current_line]
-                #print(f"\nDebug: Checking line {current_line}: {line}")
-                # Check if this line contains a date
-                if date_pattern.search(line):
-                    date_headers.append(line.strip())
-                    #print(f"Found date: {line.strip()}")
-                    current_line += 1
-                else:
-                    #print("No date found in this line, stopping date search")
-                    # If we hit a non-date line, we've found all the date headers
-                    break
-            
-            if not date_headers:
-                print("Error: No date headers found after Component row.")
+        found_header = False
+        state = _SEEK_HEADER
+
+        # A section runs from a Component row to the next one or end of file
+        for i, (line, tag, digit) in enumerate(_classify_lines(lines)):
+            if tag == _HEADER:
+                if state == _IN_DATES and not date_headers:
+                    log.error("No date headers found after Component row.")
+                log.debug("Processing section starting at line %d", i)
+                found_header = True
+                state = _IN_DATES
+                date_headers = []
+                # Initialize variables for tracking the current component being processed;
+                # a component still pending when its section ends is not kept
+                current_component = None      # The name of the current lab test (e.g., "Chloride", "CO2")
+                current_values = []          # List of test results for the current component
+                current_range = None         # Reference range for the current component
                 continue
-            
-            #print(f"Found date headers: {date_headers}")
-            all_date_headers.update(date_headers)
-            
-            # Now process the data rows (starting after the date headers)
-            data_rows = []
-            #print(f"\nDebug: Processing data rows starting from line {current_line}")
-            
-            # Initialize variables for tracking the current component being processed
-            current_component = None      # The name of the current lab test (e.g., "Chloride", "CO2")
-            current_values = []          # List of test results for the current component
-            current_range = None         # Reference range for the current component
-            value_count = 0              # Number of values collected for current component
-            i = current_line
-            
-            # Find the next section start or end of file
-            next_section_start = None
-            for next_idx in component_indices:
-                if next_idx > section_start:
-                    next_section_start = next_idx
-                    break
-            
-            # Process until we hit the next section or end of file
-            while i < (next_section_start if next_section_start else len(lines)):
-                line = lines[i]
-                
-                # CASE 1: Found a new Component header row
-                # This marks the start of a new section in the PDF
-                if line.startswith("Component"):
-                    # Save the previous component's data if we have any
-                    if current_component and len(current_values) > 0:
-                        # Pad values with empty strings if we don't have enough
-                        while len(current_values) < len(date_headers):
-                            current_values.append("")
-                        row = [current_component] + current_values + [current_range]
-                        data_rows.append(row)
-                        current_values = []
-                        value_count = 0
-                        current_range = None
-                    current_component = line
-                    i += 1
-                    continue
-                
-                # CASE 2: Found a date header
-                # Skip these as they're just column headers
-                if date_pattern.search(line):
-                    i += 1
+
+            # Lines before the first Component row, or in a section without dates
+            if state == _SEEK_HEADER:
+                continue
+
+            # The date headers are the run of date lines right after Component
+            if state == _IN_DATES:
+                if tag == _DATE:
+                    date_headers.append(line)
+                    all_date_headers.add(line)
                     continue
-                
-                # CASE 3: Found a new component name
-                # This is a line that doesn't contain numbers and isn't a normal range
-                # Examples: "Chloride", "CO2", "Sodium"
-                if not line.startswith("Normal Range:") and not any(c.isdigit() for c in line):
-                    # Skip if this is just a unit (like "m2")
-                    if line.strip().lower() in ['m2']:
-                        i += 1
-                        continue
-                        
-                    # Save the previous component's data if we have any
-                    if current_component and len(current_values) > 0:
-                        # Pad values with empty strings if we don't have enough
-                        while len(current_values) < len(date_headers):
-                            current_values.append("")
-                        row = [current_component] + current_values + [current_range]
-                        data_rows.append(row)
-                        current_values = []
-                        value_count = 0
-                        current_range = None
-                    
-                    # Start processing the new component
-                    current_component = line
-                    current_values = []
-                    current_range = None
-                    i += 1
+                if not date_headers:
+                    log.error("No date headers found after Component row.")
+                    state = _SEEK_HEADER
                     continue
+                state = _IN_ROWS
 
-                # CASE 4: Found a reference range
-                # This starts with "Normal Range:" and may span multiple lines
-                # Example: "Normal Range: 21 - 31 mmol/L"
-                elif line.startswith("Normal Range:"):
-                    # Start collecting the range text, removing the "Normal Range:" prefix
-                    range_text = line.replace("Normal Range:", "").strip()
-                    
-                    # Check subsequent lines to see if the range continues
-                    while i + 1 < len(lines):
-                        next_line = lines[i + 1].strip()
-                        # Stop if we hit a new component or a value (but not a unit)
-                        if next_line.startswith("Component") or (any(c.isdigit() for c in next_line) and not next_line.lower() in ['m2']):
-                            break
-                        # Add the next line to the range if it's not another range
-                        if not next_line.startswith("Normal Range:"):
-                            range_text += " " + next_line
-                        i += 1
-                    current_range = range_text
-                    #print(f"Debug: Found reference range for {current_component}: {current_range}")
-                    i += 1
+            # A reference range may span multiple lines; it continues until a
+            # value (a line with digits that is not a unit) or a new section
+            if state == _IN_RANGE:
+                if not digit or tag == _UNIT:
+                    # Add the line to the range if it's not another range
+                    if tag != _RANGE:
+                        range_text += " " + line
                     continue
+                current_range = range_text
+                state = _IN_ROWS
+
+            # CASE 1: Found a date header or a unit (like "m2")
+            # Skip these as they're just column headers / units
+            if tag == _DATE or tag == _UNIT:
+                continue
+
+            # CASE 2: Found a new component name
+            # Examples: "Chloride", "CO2", "Sodium"
+            if tag == _NAME:
+                # Save the previous component's data if we have any
+                if current_component and current_values:
+                    all_data_rows.append(_component_row(current_component, current_values, current_range, len(date_headers)))
+
+                # Start processing the new component; names repeat across
+                # files, so intern them to share one string per test
+                current_component = sys.intern(line)
+                current_values = []
+                current_range = None
+                continue
+
+            # CASE 3: Found a reference range
+            # This starts with "Normal Range:"
+            # Example: "Normal Range: 21 - 31 mmol/L"
+            if tag == _RANGE:
+                # Start collecting the range text, removing the "Normal Range:" prefix
+                range_text = line.replace("Normal Range:", "").strip()
+                state = _IN_RANGE
+                continue
+
+            # CASE 4: Found a test result value
+            # Examples: "103 mmol/L", "30 mmol/L"
+            # Skip if this is part of the reference range
+            if current_range and line in current_range:
+                continue
+            # Add the value to the current component's results, trying to convert to number
+            value_str = line.split()[0]  # Take everything before the first space
+            try:
+                value = float(value_str)  # Try to convert to float
+                current_values.append(value)
+                log.debug("Added numeric value %s (original: %s) for component %s", value, line, current_component)
+            except ValueError:
+                # If we can't convert to float, keep the original text
+                current_values.append(value_str)
+                log.debug("Added text value %s (original: %s) for component %s", value_str, line, current_component)
+
+        if not found_header:
+            log.error("No 'Component' header rows found in text.")
+            return None, None
+        if state == _IN_DATES and not date_headers:
+            log.error("No date headers found after Component row.")
 
-                # CASE 5: Found a test result value
-                # This is a line containing numbers that isn't part of a reference range
-                # Examples: "103 mmol/L", "30 mmol/L"
-                elif any(c.isdigit() for c in line):
-                    # Skip if this is just a unit (like "m2")
-                    if line.strip().lower() in ['m2'] or not any(c.isdigit() for c in line):
-                        i += 1
-                        continue
-                    # Skip if this is part of the reference range
-                    if current_range and line.strip() in current_range:
-                        i += 1
-                        continue
-                    # Skip if this is a new component name
-                    if not any(c.isdigit() for c in line) and not line.startswith("Normal Range:"):
-                        i += 1
-                        continue
-                    # Only add if it's a valid value (contains a number and not part of a range)
-                    if any(c.isdigit() for c in line) and not line.startswith("Normal Range:"):
-                        # Special case: Check if this line is actually a new component (like CO2)
-                        if line.strip().upper() in ['CO2']:
-                            # Save the previous component's data if we have any
-                            if current_component and len(current_values) > 0:
-                                # Pad values with empty strings if we don't have enough
-                                while len(current_values) < len(date_headers):
-                                    current_values.append("")
-                                row = [current_component] + current_values + [current_range]
-                                data_rows.append(row)
-                                current_values = []
-                                value_count = 0
-                                current_range = None
-                            # Start processing the new component
-                            current_component = line
-                            current_values = []
-                            current_range = None
-                            i += 1
-                            continue
-                        # Add the value to the current component's results, trying to convert to number
-                        value_str = line.strip().split()[0]  # Take everything before the first space
-                        try:
-                            value = float(value_str)  # Try to convert to float
-                            current_values.append(value)
-                            print(f"Debug: Added numeric value {value} (original: {line.strip()}) for component {current_component}")
-                        except ValueError:
-                            # If we can't convert to float, keep the original text
-                            current_values.append(value_str)
-                            print(f"Debug: Added text value {value_str} (original: {line.strip()}) for component {current_component}")
-                        value_count += 1
-                i += 1
-            
-            # Add the data rows from this section
-            all_data_rows.extend(data_rows)
-        
         # Convert all date headers to a sorted list
-        all_date_headers = sorted(list(all_date_headers))
+        all_date_headers = sorted(all_date_headers)
         
-        #print(f"Found {len(all_data_rows)} total valid data rows")
-        #for row in all_data_rows:
-        #    print(f"Debug: Data row: {row}")
+        # Lay the rows out against Test, the date columns of all sections and
+        # Reference Range, positionally, exactly as the original per-file
+        # DataFrame did: the longest row must fill every column, cells fill
+        # the date columns left to right and only a full-width row has its
+        # last cell in Reference Range. A row from a section with fewer dates
+        # therefore lands partly under the wrong dates, with its range in a
+        # date cell. This is kept on purpose so the combined workbook stays
+        # the same as before; mapping each section's values onto its own
+        # dates would be a separate, output-changing fix (see the pinned
+        # "short_rows" case in tests/test_extractors.py). Emit one long
+        # record per filled date cell.
+        width = len(all_date_headers) + 2
+        longest = max(map(len, all_data_rows), default=width)
+        if longest != width:
+            raise ScanLayoutError(f"longest row has {longest - 2} cells for {width - 2} date columns")
+        records = []
+        for row in all_data_rows:
+            reference_range = row[-1] if len(row) == width else None
+            for date, value in zip(all_date_headers, row[1:]):
+                records.append((row[0], date, value, reference_range))
         
-        # Create DataFrame with Test, date columns, and Reference Range
-        columns = ['Test'] + all_date_headers + ['Reference Range']
-        df = pd.DataFrame(all_data_rows, columns=columns)
-        
-        return df, all_date_headers
+        return records, all_date_headers
     except Exception as e:
-        print(f"Error in extract_table_data_scan: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        log.exception("Error in extract_table_data_scan: %s", e)
         return None, None
 
 def extract_table_data_other(text):
     """
     Extract table data from non-Scan files using a regex-based approach.
+    Returns (records, dates) with one (test, date, value, range) record per block.
     This assumes each lab result is in a block:
       Test Name
       Normal Range: [range]
       [Value]
     """
-    result_pattern = re.compile(
-        r"(?P<Test>[A-Za-z0-9 \(\)\[\]\-\/]+)\nNormal Range:\s*(?P<Range>[><=0-9.\-–\s]+[a-zA-Z/%²μ]+)\n(?P<Value>[><=0-9. \s]+[a-zA-Z/%²μ]+)",
-        re.MULTILINE
-    )
-    
-    # Extract a full date from the text using the header (if present)
-    full_date_pattern = re.compile(r"((?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},\s+\d{4})")
-    m = full_date_pattern.search(text)
+    # Extract a full date from the text using the header (if present); a plain
+    # substring check for the month names is enough to rule most texts in or out
+    if any(month in text for month in _MONTH_ABBRS):
+        m = _FULL_DATE_RE.search(text)
+    else:
+        m = None
     date = m.group(1) if m else "Unknown Date"
     
-    results = []
-    for match in result_pattern.finditer(text):
-        test = match.group("Test").strip()
-        rng = match.group("Range").strip()
-        value = match.group("Value").strip()
-        results.append({
-            'Component': test,
-            date: value,
-            'Reference Range': rng
-        })
-    if not results:
+    records = []
+    # Jump between "Normal Range:" anchors with str.find. A test name may not
+    # start before the end of the previous block, same as a finditer scan.
+    end = 0
+    anchor = text.find(_RANGE_ANCHOR)
+    while anchor != -1:
+        line_start = max(text.rfind("\n", end, anchor) + 1, end)
+        name = _TEST_TAIL_RE.search(text[line_start:anchor])
+        match = _RANGE_VALUE_RE.match(text, anchor + len(_RANGE_ANCHOR)) if name else None
+        if match:
+            records.append((sys.intern(name.group().strip()), date,
+                            match.group("Value").strip(), match.group("Range").strip()))
+            end = match.end()
+        anchor = text.find(_RANGE_ANCHOR, anchor + 1)
+    if not records:
         return None, None
-    df = pd.DataFrame(results)
-    return df, [date]
+    return records, [date]
+
+# Filename prefix (lowercase) -> extractor, checked in order; files matching
+# no prefix use extract_table_data_other. Add new report layouts here.
+_EXTRACTORS = (
+    ("scan", extract_table_data_scan),
+)
+
+def _extractor_for(filename):
+    """Pick the extractor for a file from its name."""
+    name = filename.lower()
+    for prefix, extractor in _EXTRACTORS:
+        if name.startswith(prefix):
+            return extractor
+    return extract_table_data_other
+
+# Part of every text cache key; bump it whenever extract_text_from_doc changes
+# what it returns (separators, get_text flags), so older entries are not reused
+_TEXT_CACHE_VERSION = 1
+
+def _cache_file(filepath, cache_dir):
+    """
+    Path of the text cache entry for a PDF in cache_dir, keyed on the file's
+    path, mtime and size so a changed file gets a new entry, and on the cache
+    format and PyMuPDF versions so a new extractor does not see stale text.
+    """
+    st = os.stat(filepath)
+    key = (f"{_TEXT_CACHE_VERSION}:{fitz.VersionBind}:"
+           f"{os.path.abspath(filepath)}:{st.st_mtime_ns}:{st.st_size}")
+    return os.path.join(cache_dir, hashlib.blake2b(key.encode()).hexdigest() + ".txt")
+
+def _read_cache(cache_file):
+    """Return the cached text, or None if there is no entry yet."""
+    # newline="" keeps any \r in the page text exactly as PyMuPDF returned it
+    try:
+        with open(cache_file, encoding="utf-8", newline="") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _write_cache(cache_file, text):
+    """Store extracted text for later runs."""
+    # Write under a temporary name and rename, so an interrupted run never
+    # leaves a truncated entry behind
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    os.replace(tmp_file, cache_file)
 
-def process_pdf_file(filepath):
+def process_pdf_file(filepath, cache_dir=None):
     """
     Process a PDF file based on its filename structure.
-    If the filename starts with 'Scan', use the scan-specific extraction,
-    otherwise use the generic extraction.
+    The extractor is looked up by filename prefix in _EXTRACTORS: files
+    starting with 'Scan' use the scan-specific extraction, everything else
+    the generic extraction.
+    With a cache_dir, the extracted text is cached on disk between runs and
+    the PDF is only opened when there is no entry for it yet.
     """
     filename = os.path.basename(filepath)
-    text = extract_text_from_pdf(filepath)
-    if filename.lower().startswith('scan'):
-        return extract_table_data_scan(text)
-    else:
-        return extract_table_data_other(text)
+    extractor = _extractor_for(filename)
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = _cache_file(filepath, cache_dir)
+        text = _read_cache(cache_file)
+        if text is not None:
+            return extractor(text)
+    # Open the document once and keep it open for the whole parse, so any
+    # extractor that needs more than the plain text can reuse it
+    doc = fitz.open(filepath)
+    try:
+        text = extract_text_from_doc(doc)
+        if cache_file is not None:
+            _write_cache(cache_file, text)
+        return extractor(text)
+    finally:
+        doc.close()
+
+def _init_worker(level):
+    """Set up logging in a pool worker; spawned workers do not inherit it."""
+    logging.basicConfig(level=level, format=_LOG_FORMAT)
+
+def _safe_process(filepath, cache_dir=None):
+    """
+    Worker wrapper around process_pdf_file for the process pool.
+    Returns (filepath, records, dates, error) so a bad file is reported instead
+    of tearing down the pool.
+    """
+    try:
+        records, dates = process_pdf_file(filepath, cache_dir)
+        return filepath, records, dates, None
+    except Exception as e:
+        return filepath, None, None, str(e)
 
 def main():
     parser = argparse.ArgumentParser(description='Process Labcorp PDF files and extract lab results.')
     parser.add_argument('directory', help='Directory containing PDF files to process')
-    parser.add_argument('--output', '-o', default='Combined_Lab_Results_Raw.xlsx',
-                      help='Output Excel file name (default: Combined_Lab_Results_Raw.xlsx)')
+    parser.add_argument('--output', '-o', default=None,
+                      help='Output file name (default: Combined_Lab_Results_Raw with the extension of --format)')
+    parser.add_argument('--format', '-f', choices=['xlsx', 'parquet', 'csv'], default='xlsx',
+                      help='Output file format. An output name without an extension gets this one; '
+                           'a different extension is an error (default: xlsx)')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                      help='Show debug output from the PDF parsers')
+    parser.add_argument('--workers', '-j', type=int, default=os.cpu_count() or 1,
+                      help='Number of worker processes used to parse PDFs (default: number of CPUs)')
+    parser.add_argument('--cache', action='store_true',
+                      help='Keep the extracted text of each PDF in a .pdfcache folder next to the output '
+                           'and reuse it on later runs. The text, including any patient details, is stored '
+                           'unencrypted; delete the folder to clear it (default: off)')
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    suffix = '.' + args.format
+    if args.output is None:
+        raw_output_path = Path('Combined_Lab_Results_Raw' + suffix)
+    else:
+        # The same rule for every format: a missing extension is added, a
+        # different one is refused rather than rewritten or ignored
+        raw_output_path = Path(args.output)
+        if raw_output_path.suffix.lower() != suffix:
+            if raw_output_path.suffix:
+                parser.error(f"--output {args.output} does not end in {suffix} for --format {args.format}")
+            raw_output_path = raw_output_path.with_name(raw_output_path.name + suffix)
+
+    log_level = logging.DEBUG if args.verbose else logging.WARNING
+    logging.basicConfig(level=log_level, format=_LOG_FORMAT)
 
     filepaths = get_pdf_files(args.directory)
     if not filepaths:
@@ -313,70 +436,87 @@ def main():
 
     print(f"Found {len(filepaths)} PDF files to process.")
 
+    # With --cache, extracted text is kept next to the output (creating its
+    # folder if needed), so re-runs over the same folder skip PyMuPDF for
+    # files that have not changed
+    cache_dir = None
+    if args.cache:
+        cache_dir = raw_output_path.resolve().parent / ".pdfcache"
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_dir = str(cache_dir)
+
+    # Each PDF is parsed independently, so spread the files over worker
+    # processes (PyMuPDF holds the GIL, so threads would not help here).
+    # Large folders are handed out in chunks to cut per-file IPC round trips.
     all_data = []
-    for fp in filepaths:
-        try:
-            df, dates = process_pdf_file(fp)
-            if df is not None and dates:
+    max_workers = min(args.workers, len(filepaths))
+    chunksize = max(1, len(filepaths) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(log_level,)) as executor:
+        for fp, records, dates, error in executor.map(functools.partial(_safe_process, cache_dir=cache_dir), filepaths, chunksize=chunksize):
+            if error is not None:
+                print(f"Error processing {os.path.basename(fp)}: {error}")
+            elif records is not None and dates:
                 print(f"Successfully processed: {os.path.basename(fp)}")
-                all_data.append((df, dates))
+                all_data.extend(records)
             else:
                 print(f"Could not extract table data from: {os.path.basename(fp)}")
-        except Exception as e:
-            print(f"Error processing {os.path.basename(fp)}: {str(e)}")
     
     if not all_data:
         print("No data was successfully extracted from any PDFs.")
         return
 
-    # Combine data from all files.
-    combined_data = defaultdict(dict)
-    reference_ranges = {}
-
-    for df, dates in all_data:
-        for _, row in df.iterrows():
-            test = row['Test'] #changed this
-            for date in dates:
-                if pd.notna(row.get(date, "")):
-                    combined_data[test][date] = row.get(date, "")
-            if 'Reference Range' in row and row['Reference Range']:
-                reference_ranges[test] = row['Reference Range']
-
-    all_dates = set()
-    for test, vals in combined_data.items():
-        all_dates.update(vals.keys())
-    # Sort dates chronologically using dateutil.parser.parse
-    all_dates = sorted(list(all_dates), key=lambda d: parse(d) if d != "Unknown Date" else parse("1/1/1900"))
-    
-    # Build rows for the final DataFrame
-    rows = []
-    for test in combined_data.keys():
-        row = {"Test": test} #changed this from Component to Test
-        for d in all_dates:
-            row[d] = combined_data[test].get(d, "")
-        row["Reference Range"] = reference_ranges.get(test, "")
-        rows.append(row)
-    
-    final_df = pd.DataFrame(rows)
-    
-    # Convert date columns to mm/dd/yyyy format
-    def reformat_date(date_str):
-        try:
-            dt = parse(date_str)
-            return dt.strftime("%m/%d/%Y")
-        except Exception as e:
-            return date_str
-    date_cols_formatted = [reformat_date(d) for d in all_dates]
-    rename_mapping = {old: reformat_date(old) for old in all_dates}
-    final_df.rename(columns=rename_mapping, inplace=True)
+    # Combine data from all files: the extractors already emit long
+    # (Test, Date, Value, Reference Range) records in file/row/date order, so
+    # build one frame from them and pivot back to one row per test.
+    long_df = pd.DataFrame(all_data, columns=["Test", "Date", "Value", "Reference Range"])
+
+    # Keep the last non-empty reference range seen for each test
+    ranges = long_df[long_df["Reference Range"].notna() & (long_df["Reference Range"] != "")]
+    reference_ranges = ranges.drop_duplicates("Test", keep="last").set_index("Test")["Reference Range"]
+
+    long_df = long_df[long_df["Value"].notna()]
+    # sort=False keeps tests in the order they first appear; later files win on
+    # the same test and date
+    combined = long_df.pivot_table(index="Test", columns="Date", values="Value", aggfunc="last", sort=False)
+
+    # "Unknown Date" is kept apart and goes first with its label unchanged; the
+    # real dates are parsed once into (sort key, original, mm/dd/yyyy), sorted
+    # on the key and unzipped
+    unknown = [d for d in combined.columns if d == "Unknown Date"]
+    triples = []
+    for d in combined.columns:
+        if d != "Unknown Date":
+            dt = _parsed(d)
+            triples.append((dt, d, dt.strftime("%m/%d/%Y")))
+    triples.sort(key=lambda t: t[0])
+    all_dates = unknown + [t[1] for t in triples]
+    date_cols_formatted = unknown + [t[2] for t in triples]
     
-    # Order columns: "Test", sorted date columns, then "Reference Range"
-    ordered_columns = ["Test"] + date_cols_formatted + ["Reference Range"] #changed this from Component to Test
-    final_df = final_df[ordered_columns]
+    # Select the date columns in sorted order and label them with their
+    # mm/dd/yyyy names in place, so the frame is built in its final layout
+    # ("Test", sorted date columns, then "Reference Range") without a separate
+    # rename and reorder copy
+    final_df = combined[all_dates]
+    final_df = final_df.where(final_df.notna(), "")
+    final_df.columns = date_cols_formatted
+    final_df["Reference Range"] = reference_ranges.reindex(final_df.index).fillna("")
+    final_df = final_df.reset_index()
+    # Test names and ranges repeat heavily, so store them as categoricals
+    final_df["Test"] = final_df["Test"].astype("category")
+    final_df["Reference Range"] = final_df["Reference Range"].astype("category")
     
-    # Save raw combined data to Excel (intermediate output)
-    raw_output_path = args.output
-    final_df.to_excel(raw_output_path, index=False)
+    # Save raw combined data (intermediate output)
+    if args.format == 'xlsx':
+        # xlsxwriter streams the sheet out directly instead of building openpyxl cell
+        # objects. Its constant_memory mode is not usable here: pandas writes cells
+        # column by column, and constant_memory drops anything not on the current row.
+        final_df.to_excel(raw_output_path, index=False, engine="xlsxwriter")
+    elif args.format == 'parquet':
+        # Date columns mix numbers and text, which parquet cannot store in one
+        # column, so they are written as text (the same values a CSV holds)
+        final_df.astype({d: str for d in date_cols_formatted}).to_parquet(raw_output_path, index=False)
+    else:
+        final_df.to_csv(raw_output_path, index=False)
     print(f"\nCombined lab results saved to: {raw_output_path}")
 
 if __name__ == "__main__":
@@ -1,7 +1,12 @@
+import numpy as np
 import pandas as pd
-import re, datetime
-from collections import defaultdict
-from dateutil.parser import parse
+import re
+
+# Regexes used by the helpers below, compiled once
+NON_WORD_RE = re.compile(r'[\s\W]+')  # spaces/punctuation dropped from test names
+SPACES_RE = re.compile(r'\s+')  # whitespace runs collapsed in reference ranges
+NUMBER_RE = re.compile(r"([0-9.]+)")  # numbers in ranges and result values
+EN_DASH_TO_HYPHEN = str.maketrans({'–': '-'})  # standardizes dashes in reference ranges
 
 # --- Step 1: Combine raw data from each worksheet into a single DataFrame ---
 # (Assuming 'worksheets' is a dictionary with each raw DataFrame from each file.)
@@ -12,47 +17,44 @@ from dateutil.parser import parse
 
 combined_raw_df = pd.concat(worksheets.values(), ignore_index=True)
 
+# Store the text columns as pyarrow-backed strings: compact buffers instead of
+# one Python object per cell. Date columns stay object, since they mix
+# numbers and text.
+combined_raw_df = combined_raw_df.astype({"Test": "string[pyarrow]", "Reference Range": "string[pyarrow]"})
+
 # --- Step 2: Reformat and order date columns ---
 # Identify columns that are dates. We exclude "Test" and "Reference Range" columns.
 raw_cols = combined_raw_df.columns.tolist()
 date_cols = [col for col in raw_cols if col not in ["Test", "Reference Range"]]
 
-# Define a function to parse date strings and reformat them as mm/dd/yyyy
-def reformat_date(date_str):
-    try:
-        dt = parse(date_str)
-        return dt.strftime("%m/%d/%Y")
-    except Exception as e:
-        return date_str  # if parsing fails, return original
-
-# Create a mapping for date columns: original -> reformatted
-date_col_mapping = {col: reformat_date(col) for col in date_cols}
-
-# Rename the date columns using the mapping
-combined_raw_df.rename(columns=date_col_mapping, inplace=True)
-
-# Now, re-identify the date columns (they are now in mm/dd/yyyy format)
-all_date_cols = [col for col in combined_raw_df.columns if col not in ["Test", "Reference Range"]]
-
-# Sort these date columns chronologically:
-def date_sort_key(date_str):
-    try:
-        return parse(date_str)
-    except Exception as e:
-        return datetime.datetime.max
-
-all_date_cols_sorted = sorted(all_date_cols, key=date_sort_key)
+# Parse all date headers in one vectorized call (format="mixed" parses each
+# header on its own, like dateutil did; cache=True parses repeats only once).
+# Headers that are not dates come back as NaT and keep their original name.
+parsed_dates = pd.to_datetime(pd.Index(date_cols), format="mixed", errors="coerce", cache=True)
+
+# Create a mapping for date columns: original -> reformatted as mm/dd/yyyy
+date_col_mapping = {col: (col if pd.isna(dt) else dt.strftime("%m/%d/%Y"))
+                    for col, dt in zip(date_cols, parsed_dates)}
+
+# Sort the date headers chronologically from the same parse: order by
+# calendar day (the mm/dd/yyyy names carry no time), with NaT (headers that
+# are not dates) last; the stable sort keeps ties in their original order
+date_order = np.argsort(parsed_dates.normalize().values, kind="stable")
+date_cols_sorted = [date_cols[i] for i in date_order]
+all_date_cols_sorted = [date_col_mapping[col] for col in date_cols_sorted]
 print("Ordered date columns:", all_date_cols_sorted)
 
-# Reorder the DataFrame columns: Test, sorted date columns, then Reference Range
-combined_raw_df = combined_raw_df[["Test"] + all_date_cols_sorted + ["Reference Range"]]
+# Select Test, the sorted date columns, then Reference Range and rename the
+# date columns in the same step
+combined_raw_df = combined_raw_df[["Test"] + date_cols_sorted + ["Reference Range"]].rename(columns=date_col_mapping)
 
 # --- Step 3: Deduplicate rows ---
-# Normalize test names (lowercase and strip spaces/punctuation) for grouping.
-def normalize_test_name(test):
-    return re.sub(r'[\s\W]+', '', test.strip().lower())
-
-combined_raw_df["Normalized Test"] = combined_raw_df["Test"].apply(normalize_test_name)
+# Normalize test names (lowercase and strip spaces/punctuation) for grouping,
+# with vectorized string ops over the whole column. The regex step runs on
+# Python's re: pyarrow's RE2 treats \W as ASCII-only and would drop letters
+# such as "β" from names.
+combined_raw_df["Normalized Test"] = (combined_raw_df["Test"].str.strip().str.lower()
+                                      .astype(object).str.replace(NON_WORD_RE, '', regex=True))
 
 # Define a canonical mapping manually for known duplicates.
 canonical_map = {
@@ -64,105 +66,132 @@ canonical_map = {
     # You can add additional mappings as needed.
 }
 
-def get_canonical(test_norm):
-    return canonical_map.get(test_norm, test_norm)
+# Names without a mapping are their own canonical name
+combined_raw_df["Canonical Test"] = (combined_raw_df["Normalized Test"].map(canonical_map)
+                                     .fillna(combined_raw_df["Normalized Test"]))
 
-combined_raw_df["Canonical Test"] = combined_raw_df["Normalized Test"].apply(get_canonical)
-
-# Now, group by "Canonical Test" and "Reference Range" (after normalizing reference range)
-def normalize_ref(ref):
-    # Lowercase, remove extra spaces, standardize dash
-    return re.sub(r'\s+', ' ', ref.strip().replace('–', '-').lower())
-
-combined_raw_df["Normalized Ref"] = combined_raw_df["Reference Range"].apply(normalize_ref)
+# Now, group by "Canonical Test" and "Reference Range" (after normalizing reference range):
+# lowercase, remove extra spaces, standardize dash, over the whole column at once.
+# A missing range normalizes to "" instead of failing. Like the test names,
+# this runs on Python's string semantics so non-ASCII whitespace still collapses.
+combined_raw_df["Normalized Ref"] = (combined_raw_df["Reference Range"].fillna("").astype(object)
+                                     .str.strip().str.translate(EN_DASH_TO_HYPHEN).str.lower()
+                                     .str.replace(SPACES_RE, ' ', regex=True))
 
 # For each group, merge the date columns by taking the first non-empty value.
-def merge_group(grp):
-    merged = {}
-    # For each date column, take the first non-empty cell
-    for col in all_date_cols_sorted:
-        vals = grp[col].tolist()
-        vals = [v for v in vals if v != ""]
-        merged[col] = vals[0] if vals else ""
-    # For Test, choose the longest test name among the group (assume that's canonical)
-    merged["Test"] = max(grp["Test"].tolist(), key=len)
-    # For Reference Range, assume they are all the same once normalized and take the first.
-    merged["Reference Range"] = grp["Reference Range"].iloc[0]
-    return pd.Series(merged)
-
-deduped_df = combined_raw_df.groupby(["Canonical Test", "Normalized Ref"]).apply(merge_group).reset_index(drop=True)
+# Empty strings and missing cells (dates a worksheet did not have) both count
+# as empty, so groupby.first picks the first real value per column in one pass.
+# The keys are grouped as categoricals, so groups are found from integer codes
+# instead of hashing every string; sort=False keeps groups in first-seen order
+# (the rows are sorted by Test below anyway)
+group_keys = [combined_raw_df["Canonical Test"].astype("category"),
+              combined_raw_df["Normalized Ref"].astype("category")]
+date_values = combined_raw_df[all_date_cols_sorted]
+firsts = date_values.mask(date_values.eq("")).groupby(group_keys, observed=True, sort=False).first()
+firsts = firsts.where(firsts.notna(), "")
+
+# For Test, choose the longest test name among the group (assume that's canonical);
+# idxmax picks the first of equally long names, like max(..., key=len)
+longest_rows = combined_raw_df["Test"].str.len().groupby(group_keys, observed=True, sort=False).idxmax()
+longest_tests = combined_raw_df.loc[longest_rows, "Test"].to_numpy()
+
+# For Reference Range, assume they are all the same once normalized and take the first.
+first_refs = combined_raw_df["Reference Range"].groupby(group_keys, observed=True, sort=False).first().to_numpy()
+
+# Build the deduped frame once from the aligned per-group arrays, already in
+# output order: Test, the sorted date columns, then Reference Range (the
+# grouping helper columns never reach the sheet)
+deduped_df = pd.DataFrame({
+    "Test": longest_tests,
+    **{col: firsts[col].to_numpy() for col in all_date_cols_sorted},
+    "Reference Range": first_refs,
+})
 
 # --- Step 4: Sort final rows alphabetically (case-insensitive) by Test
-deduped_df = deduped_df.sort_values(by="Test", key=lambda col: col.str.lower())
+# The lowercased names are computed once and sorted with a stable argsort, so
+# rows with the same name keep their group order
+test_order = np.argsort(deduped_df["Test"].str.lower().to_numpy(), kind="stable")
+deduped_df = deduped_df.iloc[test_order].reset_index(drop=True)
 
 print("Deduplicated number of rows:", deduped_df.shape[0])
 
-# --- Step 5: Save to an intermediate Excel file (before highlighting)
-combined_deduped_intermediate = "/mnt/data/Combined_Lab_Results_Deduped_Raw.xlsx"
-deduped_df.to_excel(combined_deduped_intermediate, index=False)
+# --- Step 5: Save an intermediate audit copy (before highlighting)
+# Parquet instead of xlsx: the highlighting below works on deduped_df in
+# memory, so this file is only a record of the deduplicated data. Date
+# columns mix numbers and text, which parquet cannot hold in one column, so
+# they are stored as text.
+combined_deduped_intermediate = "/mnt/data/Combined_Lab_Results_Deduped_Raw.parquet"
+deduped_df.astype({col: str for col in all_date_cols_sorted}).to_parquet(
+    combined_deduped_intermediate, index=False, compression="zstd")
 
 # --- Step 6: Apply yellow highlighting for out-of-range values ---
-import openpyxl
-from openpyxl.styles import PatternFill
-
-yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+# Reference range kinds for the out-of-range check
+REF_NONE, REF_RANGE, REF_LE, REF_GE, REF_LT, REF_GT = range(6)
 
-# Helper function to check out-of-range using the normalized reference range
-def is_out_of_range(ref, value):
+# Helper function to parse a (lowercased) reference range once into
+# (kind, low, high) from the first number of each bound; ranges that cannot
+# be checked (a bound with no number, or an unparseable number) give REF_NONE
+def parse_ref(ref):
     try:
-        if not ref or not value or not re.search(r"\d", value):
-            return False
-        val = float(re.findall(r"[0-9.]+", value)[0])
-        if '-' in ref:
-            parts = re.split(r'[-]', ref)
-            low = float(re.findall(r"[0-9.]+", parts[0])[0])
-            high = float(re.findall(r"[0-9.]+", parts[1])[0])
-            return val < low or val > high
+        if not ref:
+            pass
+        elif '-' in ref:
+            parts = ref.split('-')
+            low = float(NUMBER_RE.search(parts[0]).group())
+            high = float(NUMBER_RE.search(parts[1]).group())
+            return REF_RANGE, low, high
         elif "<=" in ref:
-            high = float(re.findall(r"[0-9.]+", ref)[0])
-            return val > high
+            return REF_LE, np.nan, float(NUMBER_RE.search(ref).group())
         elif ">=" in ref:
-            low = float(re.findall(r"[0-9.]+", ref)[0])
-            return val < low
+            return REF_GE, float(NUMBER_RE.search(ref).group()), np.nan
         elif "<" in ref:
-            high = float(re.findall(r"[0-9.]+", ref)[0])
-            return val >= high
+            return REF_LT, np.nan, float(NUMBER_RE.search(ref).group())
         elif ">" in ref:
-            low = float(re.findall(r"[0-9.]+", ref)[0])
-            return val <= low
+            return REF_GT, float(NUMBER_RE.search(ref).group()), np.nan
     except Exception as e:
-        return False
-    return False
-
-# Load workbook
-wb = openpyxl.load_workbook(combined_deduped_intermediate)
-ws = wb.active
-
-# Identify the column indices:
-header = [cell.value for cell in ws[1]]
-# "Test" should be column A, then date columns, then "Reference Range" as last.
-date_col_indices = []
-for idx, col_name in enumerate(header):
-    if col_name not in ["Test", "Reference Range", "Canonical Test", "Normalized Ref"]:
-        date_col_indices.append(idx+1)
-ref_col_index = header.index("Reference Range") + 1
-
-# Apply highlighting to date cells out-of-range:
-for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-    ref_val = row[ref_col_index-1].value
-    for col in date_col_indices:
-        cell = row[col-1]
-        if isinstance(cell.value, str) and is_out_of_range(ref_val.lower() if isinstance(ref_val, str) else "", cell.value):
-            cell.fill = yellow_fill
-
-# Remove the extra columns "Canonical Test" and "Normalized Ref" for final output
-final_cols = [col for col in header if col not in ["Canonical Test", "Normalized Ref"]]
-ws.delete_cols(header.index("Canonical Test")+1, 1)  # remove first occurrence (if present)
-ws.delete_cols(header.index("Normalized Ref")+1, 1)
-
-# Save final highlighted file
+        pass
+    return REF_NONE, np.nan, np.nan
+
+# Parse each row's reference range once (unique ranges only), as arrays
+refs = deduped_df["Reference Range"].map(lambda r: r.lower() if isinstance(r, str) else "")
+ref_bounds = {r: parse_ref(r) for r in refs.unique()}
+ref_kind = np.array([ref_bounds[r][0] for r in refs], dtype=np.int8)
+low = np.array([ref_bounds[r][1] for r in refs], dtype=float)[:, None]
+high = np.array([ref_bounds[r][2] for r in refs], dtype=float)[:, None]
+
+# Helper function to get the first number in each text cell of a column;
+# numbers stored as numbers, empty cells and cells without a parseable number
+# are NaN, and NaN never compares as out of range
+def first_numbers(col):
+    text = col.where(col.map(type).eq(str)).astype("string")
+    nums = pd.to_numeric(text.str.extract(NUMBER_RE, expand=False), errors="coerce")
+    return nums.to_numpy(dtype=float, na_value=np.nan)
+
+# Stack the date columns (everything between Test and Reference Range) into a
+# rows x date-columns float matrix
+date_positions = range(1, deduped_df.shape[1] - 1)
+values = np.column_stack([first_numbers(deduped_df.iloc[:, i]) for i in date_positions]) \
+    if date_positions else np.empty((len(deduped_df), 0))
+
+# Out-of-range mask for every (row, date column) cell in one pass
+out_of_range = np.select(
+    [ref_kind[:, None] == REF_RANGE, ref_kind[:, None] == REF_LE, ref_kind[:, None] == REF_GE,
+     ref_kind[:, None] == REF_LT, ref_kind[:, None] == REF_GT],
+    [(values < low) | (values > high), values > high, values < low, values >= high, values <= low],
+    default=False
+)
+
+# Write the final file in one pass with xlsxwriter instead of re-opening the
+# intermediate workbook: pandas writes every cell, then only the out-of-range
+# cells are written again with the yellow format
 final_output_path = "/mnt/data/Combined_Lab_Results_Final.xlsx"
-wb.save(final_output_path)
+with pd.ExcelWriter(final_output_path, engine="xlsxwriter") as writer:
+    deduped_df.to_excel(writer, index=False, sheet_name="Sheet1")
+    ws = writer.sheets["Sheet1"]
+    yellow_format = writer.book.add_format({"bg_color": "#FFFF00"})
+    for r, c in np.argwhere(out_of_range):
+        col = date_positions[c]
+        ws.write(int(r) + 1, col, deduped_df.iat[int(r), col], yellow_format)
 
 final_output_path
 
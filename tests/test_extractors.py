@@ -0,0 +1,222 @@
+"""
+Regression fixtures for the two text extractors in initial_pdf_processing.
+
+Each expected value is what the original DataFrame-returning extractors
+produced for the same text, converted to the (test, date, value, reference
+range) records the extractors return now: one record per non-NaN cell, row by
+row and date column by date column, with a missing range as None.
+"""
+import pytest
+
+from initial_pdf_processing import ScanLayoutError, extract_table_data_other, extract_table_data_scan
+
+
+SCAN_TWO_DATES = """Patient: Doe
+Component
+Jan 3, 2025
+Oct 16, 2024
+Sodium
+Normal Range: 135 - 145 mmol/L
+140 mmol/L
+138 mmol/L
+Chloride
+Normal Range: 98 - 107
+mmol/L
+103 mmol/L
+101 mmol/L
+eGFR
+Normal Range: >59
+>60
+m2
+Glucose
+88 mg/dL
+Notes
+"""
+
+# The first section is cut off by the second header before its row is saved,
+# and short rows in the second one are padded with empty strings
+SCAN_SECTIONS = """Component
+Jul 12, 2024
+WBC
+Normal Range: 3.4 - 10.8
+5.9
+Component
+Jan 3, 2025
+Jul 12, 2024
+Oct 16, 2024
+Sodium
+Normal Range: 135 - 145
+140
+139
+141
+Calcium
+9.5
+Notes
+"""
+
+# A row from a section with fewer dates than the file is laid out by
+# position, as the original DataFrame did: its value goes under the first
+# date column and its range under the second, with no Reference Range
+SCAN_SHORT_ROWS = """Component
+Jul 12, 2024
+WBC
+Normal Range: 3.4 - 10.8
+5.9
+RBC
+Normal Range: 4.14 - 5.80
+4.9
+Component
+Jan 3, 2025
+Jul 12, 2024
+Sodium
+Normal Range: 135 - 145
+140
+139
+Notes
+"""
+
+# More values than date columns: the table cannot be built
+SCAN_TOO_MANY_VALUES = """Component
+Jan 3, 2025
+Sodium
+Normal Range: 135 - 145
+140
+141
+Chloride
+"""
+
+SCAN_NO_HEADER = """Sodium
+Normal Range: 135 - 145
+140
+"""
+
+# Superscript and subscript digits count as digits, so "CO₂" and "10⁵" are
+# values rather than component names or units
+SCAN_UNICODE_DIGITS = """Component
+Jan 3, 2025
+Oct 16, 2024
+Bicarbonate
+Normal Range: 21 - 31 mmol/L
+CO₂
+24 mmol/L
+Platelets
+Normal Range: 150 - 450
+250 x10³/uL
+10⁵
+Notes
+"""
+
+# Dates split by a no-break or em space are still date headers
+SCAN_UNICODE_SPACES = "Component\nJan\xa03, 2025\nOct 16,\u20032024\nSodium\nNormal Range: 135 - 145\n140\n138\nNotes\n"
+
+OTHER_DATED = """LabCorp
+Date Collected: Mar 6, 2025
+Glucose
+Normal Range: 65 - 99 mg/dL
+105 mg/dL
+Free Testosterone (Direct)
+Normal Range: 8.7 - 25.1 pg/mL
+12.3 pg/mL
+TSH
+Normal Range: 0.450 - 4.500 uIU/mL
+2.1 uIU/mL
+"""
+
+OTHER_UNDATED = """LabCorp
+Ferritin
+Normal Range: 30 - 400 ng/mL
+120 ng/mL
+"""
+
+# No-break and thin spaces inside the date, range and value
+OTHER_UNICODE_SPACES = "LabCorp\nDate Collected: Mar\xa06, 2025\nGlucose\nNormal Range:\xa065 - 99\xa0mg/dL\n105\u2009mg/dL\n"
+
+OTHER_NO_RESULTS = """LabCorp
+Date Collected: Mar 6, 2025
+No results
+"""
+
+
+@pytest.mark.parametrize("text, expected", [
+    (SCAN_TWO_DATES, (
+        [
+            ('Sodium', 'Jan 3, 2025', 140.0, '135 - 145 mmol/L'),
+            ('Sodium', 'Oct 16, 2024', 138.0, '135 - 145 mmol/L'),
+            ('Chloride', 'Jan 3, 2025', 103.0, '98 - 107 mmol/L'),
+            ('Chloride', 'Oct 16, 2024', 101.0, '98 - 107 mmol/L'),
+            ('eGFR', 'Jan 3, 2025', '>60', '>59'),
+            ('eGFR', 'Oct 16, 2024', '', '>59'),
+            ('Glucose', 'Jan 3, 2025', 88.0, None),
+            ('Glucose', 'Oct 16, 2024', '', None),
+        ],
+        ['Jan 3, 2025', 'Oct 16, 2024'],
+    )),
+    (SCAN_SECTIONS, (
+        [
+            ('Sodium', 'Jan 3, 2025', 140.0, '135 - 145'),
+            ('Sodium', 'Jul 12, 2024', 139.0, '135 - 145'),
+            ('Sodium', 'Oct 16, 2024', 141.0, '135 - 145'),
+            ('Calcium', 'Jan 3, 2025', 9.5, None),
+            ('Calcium', 'Jul 12, 2024', '', None),
+            ('Calcium', 'Oct 16, 2024', '', None),
+        ],
+        ['Jan 3, 2025', 'Jul 12, 2024', 'Oct 16, 2024'],
+    )),
+    (SCAN_SHORT_ROWS, (
+        [
+            ('WBC', 'Jan 3, 2025', 5.9, None),
+            ('WBC', 'Jul 12, 2024', '3.4 - 10.8', None),
+            ('Sodium', 'Jan 3, 2025', 140.0, '135 - 145'),
+            ('Sodium', 'Jul 12, 2024', 139.0, '135 - 145'),
+        ],
+        ['Jan 3, 2025', 'Jul 12, 2024'],
+    )),
+    (SCAN_TOO_MANY_VALUES, (None, None)),
+    (SCAN_NO_HEADER, (None, None)),
+    (SCAN_UNICODE_DIGITS, (
+        [
+            ('Bicarbonate', 'Jan 3, 2025', 'CO₂', '21 - 31 mmol/L'),
+            ('Bicarbonate', 'Oct 16, 2024', 24.0, '21 - 31 mmol/L'),
+            ('Platelets', 'Jan 3, 2025', 250.0, '150 - 450'),
+            ('Platelets', 'Oct 16, 2024', '10⁵', '150 - 450'),
+        ],
+        ['Jan 3, 2025', 'Oct 16, 2024'],
+    )),
+    (SCAN_UNICODE_SPACES, (
+        [
+            ('Sodium', 'Jan\xa03, 2025', 140.0, '135 - 145'),
+            ('Sodium', 'Oct 16,\u20032024', 138.0, '135 - 145'),
+        ],
+        ['Jan\xa03, 2025', 'Oct 16,\u20032024'],
+    )),
+], ids=["two_dates", "sections", "short_rows", "too_many_values", "no_header", "unicode_digits", "unicode_spaces"])
+def test_extract_table_data_scan(text, expected):
+    assert extract_table_data_scan(text) == expected
+
+
+def test_scan_layout_error_is_logged(caplog):
+    extract_table_data_scan(SCAN_TOO_MANY_VALUES)
+    assert any(isinstance(r.exc_info[1], ScanLayoutError) for r in caplog.records if r.exc_info)
+
+
+@pytest.mark.parametrize("text, expected", [
+    (OTHER_DATED, (
+        [
+            ('Glucose', 'Mar 6, 2025', '105 mg/dL', '65 - 99 mg/dL'),
+            ('Free Testosterone (Direct)', 'Mar 6, 2025', '12.3 pg/mL', '8.7 - 25.1 pg/mL'),
+            ('TSH', 'Mar 6, 2025', '2.1 uIU/mL', '0.450 - 4.500 uIU/mL'),
+        ],
+        ['Mar 6, 2025'],
+    )),
+    (OTHER_UNDATED, (
+        [('Ferritin', 'Unknown Date', '120 ng/mL', '30 - 400 ng/mL')],
+        ['Unknown Date'],
+    )),
+    (OTHER_UNICODE_SPACES, (
+        [('Glucose', 'Mar\xa06, 2025', '105\u2009mg/dL', '65 - 99\xa0mg/dL')],
+        ['Mar\xa06, 2025'],
+    )),
+    (OTHER_NO_RESULTS, (None, None)),
+], ids=["dated", "undated", "unicode_spaces", "no_results"])
+def test_extract_table_data_other(text, expected):
+    assert extract_table_data_other(text) == expected
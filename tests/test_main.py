@@ -0,0 +1,186 @@
+"""
+End-to-end runs of initial_pdf_processing.main() on small PDFs built with
+PyMuPDF in a temporary folder.
+"""
+import os
+import sys
+
+import fitz
+import pandas as pd
+import pytest
+
+import initial_pdf_processing
+from initial_pdf_processing import main
+
+
+PDFS = {
+    "Scan CMP.pdf": """Patient: Doe
+Component
+Jan 3, 2025
+Oct 16, 2024
+Sodium
+Normal Range: 135 - 145 mmol/L
+140 mmol/L
+138 mmol/L
+Glucose
+Normal Range: 65 - 99 mg/dL
+88 mg/dL
+92 mg/dL
+Notes""",
+    "Labcorp Mar 2025.pdf": """LabCorp
+Date Collected: Mar 6, 2025
+Glucose
+Normal Range: 65 - 99 mg/dL
+105 mg/dL
+TSH
+Normal Range: 0.450 - 4.500 uIU/mL
+2.1 uIU/mL""",
+    "Labcorp undated.pdf": """LabCorp
+Ferritin
+Normal Range: 30 - 400 ng/mL
+120 ng/mL""",
+}
+
+COLUMNS = ["Test", "Unknown Date", "10/16/2024", "01/03/2025", "03/06/2025", "Reference Range"]
+
+
+def _write_pdf(path, text):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+
+
+@pytest.fixture
+def pdf_dir(tmp_path):
+    folder = tmp_path / "pdfs"
+    folder.mkdir()
+    for name, text in PDFS.items():
+        _write_pdf(folder / name, text)
+    return folder
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["initial_pdf_processing.py", *map(str, args)])
+    main()
+
+
+@pytest.mark.parametrize("args, written", [
+    ([], "Combined_Lab_Results_Raw.xlsx"),
+    (["-f", "csv"], "Combined_Lab_Results_Raw.csv"),
+    (["-o", "res"], "res.xlsx"),
+    (["-o", "res.XLSX"], "res.XLSX"),
+    (["-o", "res", "-f", "parquet"], "res.parquet"),
+    (["-o", "res.csv", "-f", "csv"], "res.csv"),
+])
+def test_output_name(monkeypatch, tmp_path, pdf_dir, args, written):
+    monkeypatch.chdir(tmp_path)
+    run_main(monkeypatch, pdf_dir, *args)
+    assert (tmp_path / written).is_file()
+
+
+@pytest.mark.parametrize("args", [
+    ["-o", "res.csv"],
+    ["-o", "res.xlsx", "-f", "csv"],
+    ["-o", "Lab.v2"],
+])
+def test_output_name_with_other_extension_is_refused(monkeypatch, tmp_path, pdf_dir, args):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit) as exc:
+        run_main(monkeypatch, pdf_dir, *args)
+    assert exc.value.code == 2
+    assert not any(tmp_path.glob("res*")) and not any(tmp_path.glob("Lab*"))
+
+
+def test_formats_hold_the_same_table(monkeypatch, tmp_path, pdf_dir):
+    for fmt in ("xlsx", "csv", "parquet"):
+        run_main(monkeypatch, pdf_dir, "-o", tmp_path / "res", "-f", fmt)
+    xlsx = pd.read_excel(tmp_path / "res.xlsx", dtype=str).fillna("")
+    csv = pd.read_csv(tmp_path / "res.csv", dtype=str, keep_default_na=False)
+    parquet = pd.read_parquet(tmp_path / "res.parquet").astype(str)
+    assert (tmp_path / "res.xlsx").read_bytes()[:2] == b"PK"
+    assert xlsx.columns.tolist() == csv.columns.tolist() == parquet.columns.tolist() == COLUMNS
+    pd.testing.assert_frame_equal(csv, parquet)
+    assert xlsx["Test"].tolist() == csv["Test"].tolist()
+
+
+def test_combines_files_into_one_row_per_test(monkeypatch, tmp_path, pdf_dir):
+    run_main(monkeypatch, pdf_dir, "-o", tmp_path / "res.xlsx")
+    result = pd.read_excel(tmp_path / "res.xlsx", dtype=str).fillna("")
+    # "Unknown Date" goes first, the real dates follow in calendar order
+    assert result.columns.tolist() == COLUMNS
+    # Tests follow file order, so compare them by name
+    rows = {row[0]: row[1:] for row in result.values.tolist()}
+    assert rows == {
+        "Sodium": ["", "138", "140", "", "135 - 145 mmol/L"],
+        "Glucose": ["", "92", "88", "105 mg/dL", "65 - 99 mg/dL"],
+        "TSH": ["", "", "", "2.1 uIU/mL", "0.450 - 4.500 uIU/mL"],
+        "Ferritin": ["120 ng/mL", "", "", "", "30 - 400 ng/mL"],
+    }
+
+
+def test_no_table_data(monkeypatch, tmp_path, capsys):
+    folder = tmp_path / "pdfs"
+    folder.mkdir()
+    _write_pdf(folder / "notes.pdf", "Nothing to see here")
+    run_main(monkeypatch, folder, "-o", tmp_path / "res.xlsx")
+    assert "No data was successfully extracted" in capsys.readouterr().out
+    assert not (tmp_path / "res.xlsx").exists()
+
+
+def _sodium_jan(path):
+    result = pd.read_excel(path, dtype=str).set_index("Test")
+    return result.loc["Sodium", "01/03/2025"]
+
+
+def test_cache_is_off_by_default(monkeypatch, tmp_path, pdf_dir):
+    run_main(monkeypatch, pdf_dir, "-o", tmp_path / "res.xlsx")
+    assert not (tmp_path / ".pdfcache").exists()
+
+
+def test_cache_hit_and_miss(monkeypatch, tmp_path, pdf_dir):
+    out = tmp_path / "res.xlsx"
+    cache = tmp_path / ".pdfcache"
+    run_main(monkeypatch, pdf_dir, "-o", out, "--cache")
+    entries = sorted(cache.iterdir())
+    assert len(entries) == len(PDFS)
+
+    # A hit parses the cached text, not the PDF
+    for entry in entries:
+        entry.write_text(entry.read_text(encoding="utf-8").replace("140 mmol/L", "141 mmol/L"), encoding="utf-8")
+    run_main(monkeypatch, pdf_dir, "-o", out, "--cache")
+    assert _sodium_jan(out) == "141"
+
+    # A changed PDF is a new key, so it is extracted again
+    scan = pdf_dir / "Scan CMP.pdf"
+    st = scan.stat()
+    os.utime(scan, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    run_main(monkeypatch, pdf_dir, "-o", out, "--cache")
+    assert _sodium_jan(out) == "140"
+    assert len(list(cache.iterdir())) == len(PDFS) + 1
+
+
+def test_cache_key_has_version(monkeypatch, pdf_dir, tmp_path):
+    pdf = pdf_dir / "Scan CMP.pdf"
+    before = initial_pdf_processing._cache_file(pdf, tmp_path)
+    monkeypatch.setattr(initial_pdf_processing, "_TEXT_CACHE_VERSION", initial_pdf_processing._TEXT_CACHE_VERSION + 1)
+    assert initial_pdf_processing._cache_file(pdf, tmp_path) != before
+
+
+def test_cache_creates_missing_output_folder(monkeypatch, tmp_path, pdf_dir):
+    out = tmp_path / "new" / "sub" / "res.xlsx"
+    run_main(monkeypatch, pdf_dir, "-o", out, "--cache")
+    assert out.is_file()
+    assert (out.parent / ".pdfcache").is_dir()
+
+
+def test_worker_count_does_not_change_the_table(monkeypatch, tmp_path, pdf_dir):
+    for workers in (1, 3):
+        run_main(monkeypatch, pdf_dir, "-o", tmp_path / f"res{workers}.xlsx", "-j", workers)
+    pd.testing.assert_frame_equal(pd.read_excel(tmp_path / "res1.xlsx"), pd.read_excel(tmp_path / "res3.xlsx"))
+
+
+def test_workers_must_be_positive(monkeypatch, tmp_path, pdf_dir):
+    with pytest.raises(SystemExit) as exc:
+        run_main(monkeypatch, pdf_dir, "-o", tmp_path / "res.xlsx", "-j", 0)
+    assert exc.value.code == 2